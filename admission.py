@@ -0,0 +1,152 @@
+import asyncio
+import heapq
+import itertools
+import os
+import time
+
+# route classes, lower priority value is served first
+WRITE = "write"
+LIVE = "live"
+BULK = "bulk"
+
+PRIORITY = {WRITE: 0, LIVE: 1, BULK: 2}
+
+# (max concurrent requests, max seconds a request may wait for a slot)
+LIMITS = {
+    WRITE: (int(os.getenv("ADMIT_WRITE_LIMIT", "6")), float(os.getenv("ADMIT_WRITE_WAIT", "10"))),
+    LIVE: (int(os.getenv("ADMIT_LIVE_LIMIT", "4")), float(os.getenv("ADMIT_LIVE_WAIT", "2"))),
+    BULK: (int(os.getenv("ADMIT_BULK_LIMIT", "2")), float(os.getenv("ADMIT_BULK_WAIT", "1"))),
+}
+# shared by all classes, roughly the number of db connections the pi should hold at once
+TOTAL_LIMIT = int(os.getenv("ADMIT_TOTAL_LIMIT", "8"))
+MAX_QUEUE = int(os.getenv("ADMIT_MAX_QUEUE", "100"))
+
+class Overloaded(Exception):
+    def __init__(self, retry_after):
+        self.retry_after = retry_after
+
+def classify(method, path):
+    if method in ("POST", "PUT", "PATCH", "DELETE"):
+        return WRITE
+    # full parameter history and change feeds are the expensive reads, a single
+    # /soils/parameters/{Soil_ID}/{Parameter_ID} lookup is not
+    parts = path.strip("/").split("/")
+    if parts[:2] == ["soils", "parameters"] and len(parts) == 3:
+        return BULK
+    if parts[0] == "sync":
+        return BULK
+    return LIVE
+
+class AdmissionController:
+    """Per-class concurrency limits on top of a shared slot pool, waiters served by class priority."""
+
+    def __init__(self, limits=LIMITS, total_limit=TOTAL_LIMIT, max_queue=MAX_QUEUE):
+        self.limits = limits
+        self.total_limit = total_limit
+        self.max_queue = max_queue
+        self.running = {name: 0 for name in limits}
+        self.total_running = 0
+        self.waiters = []  # heap of (priority, seq, route_class, future)
+        self.seq = itertools.count()
+        self.stats = {name: {"admitted": 0, "shed": 0, "wait_total": 0.0, "wait_max": 0.0} for name in limits}
+
+    def can_run(self, route_class):
+        return self.total_running < self.total_limit and self.running[route_class] < self.limits[route_class][0]
+
+    def start(self, route_class):
+        self.running[route_class] += 1
+        self.total_running += 1
+
+    def wake_waiters(self):
+        # hand free slots to the best waiters, skipping classes already at their own limit
+        skipped = []
+        while self.waiters and self.total_running < self.total_limit:
+            entry = heapq.heappop(self.waiters)
+            _, _, route_class, future = entry
+            if future.done():
+                continue
+            if self.can_run(route_class):
+                self.start(route_class)
+                future.set_result(None)
+            else:
+                skipped.append(entry)
+        for entry in skipped:
+            heapq.heappush(self.waiters, entry)
+
+    def make_room(self, route_class):
+        """Check the queue has space for a new waiter, evicting a lower priority one if needed."""
+        self.waiters = [entry for entry in self.waiters if not entry[3].done()]
+        heapq.heapify(self.waiters)
+        if len(self.waiters) < self.max_queue:
+            return True
+        # the newest waiter of the lowest priority class goes, so a read flood
+        # filling the queue never turns away a write
+        worst = max(self.waiters, key=lambda entry: (entry[0], entry[1]))
+        if worst[0] <= PRIORITY[route_class]:
+            return False
+        self.waiters.remove(worst)
+        heapq.heapify(self.waiters)
+        self.stats[worst[2]]["shed"] += 1
+        # failing the future rather than cancelling it, the waiter gets Overloaded
+        # instead of a CancelledError that looks like the client going away
+        worst[3].set_exception(Overloaded(self.retry_after(worst[2])))
+        return True
+
+    def retry_after(self, route_class):
+        return max(1, round(self.limits[route_class][1]))
+
+    async def acquire(self, route_class):
+        started = time.monotonic()
+        # waiters are woken on every release, so any still queued are held by their own
+        # class limit and a request that fits now is not jumping ahead of anyone
+        if self.can_run(route_class):
+            self.start(route_class)
+        else:
+            if not self.make_room(route_class):
+                self.stats[route_class]["shed"] += 1
+                raise Overloaded(self.retry_after(route_class))
+            future = asyncio.get_running_loop().create_future()
+            heapq.heappush(self.waiters, (PRIORITY[route_class], next(self.seq), route_class, future))
+            self.wake_waiters()
+            try:
+                await asyncio.wait_for(asyncio.shield(future), self.limits[route_class][1])
+            except asyncio.TimeoutError:
+                # a slot granted just as the wait ran out is kept
+                if not future.done():
+                    future.cancel()
+                    self.stats[route_class]["shed"] += 1
+                    raise Overloaded(self.retry_after(route_class))
+            except asyncio.CancelledError:
+                # client went away while queued, give back a slot it may have been handed
+                if future.done() and not future.cancelled():
+                    self.release(route_class)
+                else:
+                    future.cancel()
+                raise
+        waited = time.monotonic() - started
+        stats = self.stats[route_class]
+        stats["admitted"] += 1
+        stats["wait_total"] += waited
+        stats["wait_max"] = max(stats["wait_max"], waited)
+
+    def release(self, route_class):
+        self.running[route_class] -= 1
+        self.total_running -= 1
+        self.wake_waiters()
+
+    def metrics(self):
+        queued = {name: 0 for name in self.limits}
+        for _, _, route_class, future in self.waiters:
+            if not future.done():
+                queued[route_class] += 1
+        return {
+            name: {
+                "running": self.running[name],
+                "queued": queued[name],
+                "admitted": s["admitted"],
+                "shed": s["shed"],
+                "wait_avg_ms": round(s["wait_total"] / s["admitted"] * 1000, 2) if s["admitted"] else 0.0,
+                "wait_max_ms": round(s["wait_max"] * 1000, 2),
+            }
+            for name, s in self.stats.items()
+        }
@@ -0,0 +1,204 @@
+import asyncio
+import fcntl
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from itertools import groupby
+
+import aiomysql
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from dotenv import load_dotenv
+
+load_dotenv()
+
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "archive")
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "90"))
+ARCHIVE_INTERVAL = int(os.getenv("ARCHIVE_INTERVAL", "3600"))  # seconds between runs
+ARCHIVE_BATCH = 5000
+
+# same column order as the SELECT in main.get_parameters so rows can be merged as-is
+COLUMNS = ["Parameters_ID", "HUM", "TEMP", "EC", "PH", "NITROGEN", "PHOSPHORUS", "POTASSIUM", "Comments", "Date_Recorded", "Suitable", "Suitability", "Model_Version"]
+
+# floats are kept as the float64 values the db driver returns, so an archived
+# reading serializes exactly like the same reading from the table
+SCHEMA = pa.schema([
+    ("Parameters_ID", pa.int32()),
+    ("HUM", pa.float64()),
+    ("TEMP", pa.float64()),
+    ("EC", pa.float64()),
+    ("PH", pa.float64()),
+    ("NITROGEN", pa.float64()),
+    ("PHOSPHORUS", pa.float64()),
+    ("POTASSIUM", pa.float64()),
+    ("Comments", pa.string()),
+    ("Date_Recorded", pa.timestamp("s")),
+    ("Suitable", pa.int8()),
+    ("Suitability", pa.float64()),
+    ("Model_Version", pa.string()),
+])
+
+# one file per soil/month partition, new rows are merged into it
+PARTITION_FILE = "data.parquet"
+
+PARTITION_SCHEMA = pa.schema([("soil_id", pa.int32()), ("month", pa.string())])
+MONTH_SCHEMA = pa.schema([("month", pa.string())])
+
+def open_dataset(soil_id=None):
+    # a soil's own directory so reads do not list every other soil's files
+    if soil_id is None:
+        root, partition_schema = ARCHIVE_DIR, PARTITION_SCHEMA
+    else:
+        root, partition_schema = partition_dir(soil_id), MONTH_SCHEMA
+    # explicit schema so files written before a column existed read it as null
+    schema = pa.unify_schemas([SCHEMA, partition_schema])
+    return ds.dataset(root, schema=schema, format="parquet", partitioning=ds.partitioning(partition_schema, flavor="hive"))
+
+def to_local_naive(date):
+    # Date_Recorded is a mysql timestamp, stored and compared as naive server local time
+    if date is not None and date.tzinfo is not None:
+        return date.astimezone().replace(tzinfo=None)
+    return date
+
+def partition_dir(soil_id, month=None):
+    path = os.path.join(ARCHIVE_DIR, f"soil_id={soil_id}")
+    if month is not None:
+        path = os.path.join(path, f"month={month}")
+    return path
+
+@contextmanager
+def archive_lock():
+    # file lock so the api (threads) and the archiver (own process) never rewrite
+    # the same partition at once
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    with open(os.path.join(ARCHIVE_DIR, ".lock"), "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def replace_file(table, path):
+    # unique dot-prefixed temp name in the same dir, discovery skips it and the
+    # rename is atomic, so readers never see half a file
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".", suffix=".parquet")
+    os.close(fd)
+    try:
+        pq.write_table(table, tmp, compression="zstd", use_dictionary=["Comments"])
+        os.replace(tmp, path)
+    except BaseException:
+        os.remove(tmp)
+        raise
+
+def write_partition(soil_id, month, rows):
+    """Merge rows into the partition's file, replacing any readings already archived."""
+    path = partition_dir(soil_id, month)
+    table = pa.Table.from_pylist([dict(zip(COLUMNS, row)) for row in rows], schema=SCHEMA)
+    with archive_lock():
+        os.makedirs(path, exist_ok=True)
+        existing = [os.path.join(path, name) for name in os.listdir(path) if name.endswith(".parquet") and not name.startswith((".", "_"))]
+        if existing:
+            old = ds.dataset(existing, schema=SCHEMA, format="parquet").to_table()
+            # a run that crashed before its delete archives the same reading again
+            old = old.filter(pc.invert(pc.is_in(old.column("Parameters_ID"), value_set=table.column("Parameters_ID"))))
+            table = pa.concat_tables([old, table])
+        replace_file(table.sort_by("Parameters_ID"), os.path.join(path, PARTITION_FILE))
+        for name in existing:
+            if os.path.basename(name) != PARTITION_FILE:
+                os.remove(name)
+
+def read_archived_parameters(soil_id, since=None, until=None, parameter_id=None, parameter_ids=None):
+    """Return archived rows for a soil as tuples in COLUMNS order, oldest first."""
+    if not os.path.isdir(partition_dir(soil_id)):
+        return []
+    dataset = open_dataset(soil_id)
+    since, until = to_local_naive(since), to_local_naive(until)
+    # month filters prune directories, the rest is pushed down to row group stats
+    expr = ds.scalar(True)
+    if since is not None:
+        expr &= (ds.field("month") >= since.strftime("%Y-%m")) & (ds.field("Date_Recorded") >= since)
+    if until is not None:
+        expr &= (ds.field("month") <= until.strftime("%Y-%m")) & (ds.field("Date_Recorded") <= until)
+    if parameter_id is not None:
+        expr &= ds.field("Parameters_ID") == parameter_id
+    if parameter_ids is not None:
+        expr &= ds.field("Parameters_ID").isin(list(parameter_ids))
+    table = dataset.to_table(columns=COLUMNS, filter=expr).sort_by("Parameters_ID")
+    columns = [table.column(name).to_pylist() for name in COLUMNS]
+    # files from before partitions were merged can still hold a reading twice
+    rows = {}
+    for row in zip(*columns):
+        rows[row[0]] = row
+    return list(rows.values())
+
+def delete_archived_soil(soil_id):
+    shutil.rmtree(partition_dir(soil_id), ignore_errors=True)
+
+def delete_archived_parameter(soil_id, Parameter_ID):
+    """Rewrite the soil's archive files holding a parameter without it. Returns True if found."""
+    if soil_id is None or not os.path.isdir(partition_dir(soil_id)):
+        return False
+    found = False
+    with archive_lock():
+        for fragment in open_dataset(soil_id).get_fragments():
+            table = fragment.to_table(schema=SCHEMA)
+            keep = table.filter(ds.field("Parameters_ID") != Parameter_ID)
+            if keep.num_rows == table.num_rows:
+                continue
+            found = True
+            if keep.num_rows == 0:
+                os.remove(fragment.path)
+            else:
+                replace_file(keep, fragment.path)
+    return found
+
+async def archive_old_parameters(conn, older_than_days=ARCHIVE_AFTER_DAYS, soil_id=None):
+    """Move whole months of readings older than the cutoff from the Parameters table into the archive."""
+    # only complete months move, so a partition is written about once instead of every run
+    cutoff = (datetime.now() - timedelta(days=older_than_days)).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    query = "SELECT Soil_ID, Parameters_ID, HUM, TEMP, EC, PH, NITROGEN, PHOSPHORUS, POTASSIUM, Comments, Date_Recorded, Suitable, Suitability, Model_Version FROM Parameters WHERE Date_Recorded < %s"
+    args = [cutoff]
+    if soil_id is not None:
+        query += " AND Soil_ID = %s"
+        args.append(soil_id)
+    moved = 0
+    async with conn.cursor() as cur:
+        while True:
+            await cur.execute(query + " ORDER BY Soil_ID, Date_Recorded, Parameters_ID LIMIT %s", args + [ARCHIVE_BATCH])
+            rows = await cur.fetchall()
+            if not rows:
+                break
+            for (soil_id, month), group in groupby(rows, key=lambda r: (r[0], r[10].strftime("%Y-%m"))):
+                write_partition(soil_id, month, [row[1:] for row in group])
+            # files are on disk before the delete, a crash in between archives these
+            # readings again on the next run and write_partition replaces them
+            ids = [row[1] for row in rows]
+            await cur.execute(
+                "DELETE FROM Parameters WHERE Parameters_ID IN (" + ", ".join(["%s"] * len(ids)) + ")",
+                ids
+            )
+            await conn.commit()
+            moved += len(rows)
+    return moved
+
+async def main():
+    while True:
+        try:
+            async with aiomysql.connect(
+                host=os.getenv("HOST"),
+                user=os.getenv("DEV_USER"),
+                password=os.getenv("DEV_PASSWORD"),
+                db=os.getenv("PROD_DB"),
+            ) as conn:
+                moved = await archive_old_parameters(conn)
+                print(f"Archived {moved} readings older than {ARCHIVE_AFTER_DAYS} days")
+        except Exception as e:
+            print(f"Archive run failed: {e}")
+        await asyncio.sleep(ARCHIVE_INTERVAL)
+
+if __name__ == "__main__":
+    asyncio.run(main())
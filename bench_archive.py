@@ -0,0 +1,108 @@
+# Benchmark for the Parameters archive: db size, insert speed and scan speed
+# before and after moving old readings to parquet.
+# Run against a test database, it inserts and then removes a throwaway soil.
+# Only that soil is archived, into a temporary directory.
+#   python bench_archive.py [n_rows]
+import asyncio
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import aiomysql
+from dotenv import load_dotenv
+
+import archiver
+
+load_dotenv()
+
+INSERT_SQL = "INSERT INTO Parameters (Soil_ID, HUM, TEMP, EC, PH, NITROGEN, PHOSPHORUS, POTASSIUM, Comments, Date_Recorded) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)"
+SCAN_SQL = "SELECT Parameters_ID, HUM, TEMP, EC, PH, NITROGEN, PHOSPHORUS, POTASSIUM, Comments, Date_Recorded FROM Parameters WHERE Soil_ID = %s"
+
+def fake_row(soil_id, recorded):
+    return (soil_id, random.uniform(0, 100), random.uniform(18, 35), random.uniform(500, 2000), random.uniform(5, 8),
+            random.uniform(40, 100), random.uniform(15, 25), random.uniform(120, 200), "bench reading", recorded)
+
+async def table_size(cur):
+    await cur.execute("ANALYZE TABLE Parameters")
+    await cur.fetchall()
+    await cur.execute("SELECT DATA_LENGTH + INDEX_LENGTH FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'Parameters'")
+    return (await cur.fetchone())[0]
+
+def archive_size():
+    total = 0
+    for root, _, files in os.walk(archiver.ARCHIVE_DIR):
+        total += sum(os.path.getsize(os.path.join(root, f)) for f in files)
+    return total
+
+async def time_inserts(conn, cur, soil_id, n=200):
+    start = time.perf_counter()
+    for _ in range(n):
+        await cur.execute(INSERT_SQL, fake_row(soil_id, datetime.now()))
+        await conn.commit()
+    return n / (time.perf_counter() - start)
+
+async def time_scan(cur, soil_id):
+    start = time.perf_counter()
+    await cur.execute(SCAN_SQL, (soil_id,))
+    rows = await cur.fetchall()
+    return len(rows), time.perf_counter() - start
+
+async def report(label, conn, cur, soil_id):
+    size = await table_size(cur)
+    inserts = await time_inserts(conn, cur, soil_id)
+    n, scan = await time_scan(cur, soil_id)
+    print(f"[{label}] db size: {size / 1024:.0f} KiB, archive: {archive_size() / 1024:.0f} KiB")
+    print(f"[{label}] inserts: {inserts:.0f} rows/s, db scan: {n} rows in {scan * 1000:.1f} ms")
+
+async def main(n_rows):
+    # never touch the real archive the api serves from
+    archiver.ARCHIVE_DIR = tempfile.mkdtemp(prefix="bench_archive_")
+    try:
+        await run(n_rows)
+    finally:
+        shutil.rmtree(archiver.ARCHIVE_DIR, ignore_errors=True)
+
+async def run(n_rows):
+    async with aiomysql.connect(
+        host=os.getenv("HOST"),
+        user=os.getenv("DEV_USER"),
+        password=os.getenv("DEV_PASSWORD"),
+        db=os.getenv("DEV_DB"),
+    ) as conn:
+        async with conn.cursor() as cur:
+            await cur.execute("INSERT INTO Soils (Soil_Name, Soil_Location) VALUES ('bench', ST_GeomFromText('POINT(0 0)', 4326))")
+            await cur.execute("SELECT LAST_INSERT_ID()")
+            soil_id = (await cur.fetchone())[0]
+            try:
+                # spread readings over the last two years so most are archivable
+                now = datetime.now()
+                rows = [fake_row(soil_id, now - timedelta(minutes=random.randint(0, 2 * 365 * 24 * 60))) for _ in range(n_rows)]
+                for i in range(0, n_rows, 1000):
+                    await cur.executemany(INSERT_SQL, rows[i:i + 1000])
+                await conn.commit()
+
+                await report("before", conn, cur, soil_id)
+
+                start = time.perf_counter()
+                moved = await archiver.archive_old_parameters(conn, soil_id=soil_id)
+                print(f"archived {moved} rows in {time.perf_counter() - start:.2f} s")
+
+                await report("after", conn, cur, soil_id)
+                start = time.perf_counter()
+                archived = archiver.read_archived_parameters(soil_id)
+                print(f"[after] archive scan: {len(archived)} rows in {(time.perf_counter() - start) * 1000:.1f} ms")
+                since = now - timedelta(days=120)
+                start = time.perf_counter()
+                recent = archiver.read_archived_parameters(soil_id, since=since)
+                print(f"[after] archive scan since {since:%Y-%m-%d}: {len(recent)} rows in {(time.perf_counter() - start) * 1000:.1f} ms")
+            finally:
+                await cur.execute("DELETE FROM Parameters WHERE Soil_ID = %s", (soil_id,))
+                await cur.execute("DELETE FROM Soils WHERE Soil_ID = %s", (soil_id,))
+                await conn.commit()
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 50000))
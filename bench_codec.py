@@ -0,0 +1,53 @@
+# Benchmark for the sensor payloads: bytes per reading and encode/decode
+# throughput of the text (json per reading) and binary (batched) formats.
+#   python bench_codec.py [n_readings] [batch_size]
+import json
+import random
+import sys
+import time
+
+from sensor_codec import FIELDS, encode_batch, decode_batch, parse_line
+
+def fake_line():
+    return json.dumps({
+        "Moist": round(random.uniform(0, 100), 2),
+        "Temp": round(random.uniform(-40, 80), 2),
+        "EC": round(random.uniform(0, 20000), 2),
+        "pH": round(random.uniform(3, 9), 1),
+        "nitrogen": round(random.uniform(1, 2999), 2),
+        "phosphorus": round(random.uniform(1, 2999), 2),
+        "potassium": round(random.uniform(1, 2999), 2),
+    })
+
+def main(n, batch_size):
+    lines = [fake_line() for _ in range(n)]
+    now = time.time()
+    readings = [(1, now + i, parse_line(line)) for i, line in enumerate(lines)]
+
+    start = time.perf_counter()
+    text_payloads = [line.encode("utf-8") for line in lines]
+    text_encode = time.perf_counter() - start
+    start = time.perf_counter()
+    text_decoded = [[json.loads(p)[name] for name in FIELDS] for p in text_payloads]
+    text_decode = time.perf_counter() - start
+
+    start = time.perf_counter()
+    bin_payloads = [encode_batch(readings[i:i + batch_size]) for i in range(0, n, batch_size)]
+    bin_encode = time.perf_counter() - start
+    start = time.perf_counter()
+    bin_decoded = [decode_batch(p) for p in bin_payloads]
+    bin_decode = time.perf_counter() - start
+
+    assert sum(len(a) for a in bin_decoded) == len(text_decoded) == n
+
+    text_bytes = sum(len(p) for p in text_payloads)
+    bin_bytes = sum(len(p) for p in bin_payloads)
+    print(f"{n} readings, binary batch size {batch_size}")
+    print(f"text:   {text_bytes / n:6.1f} bytes/reading, {len(text_payloads)} messages, "
+          f"encode {n / text_encode:,.0f}/s, decode {n / text_decode:,.0f}/s")
+    print(f"binary: {bin_bytes / n:6.1f} bytes/reading, {len(bin_payloads)} messages, "
+          f"encode {n / bin_encode:,.0f}/s, decode {n / bin_decode:,.0f}/s")
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 10)
@@ -1,31 +1,131 @@
-import socket 
+import socket
+import select
+import struct
+import fcntl
 import time
 import json
 
 BROADCAST_IP = "255.255.255.255"
-PORT = 5005
+PORT = 5005            # clients listen here for announcements
+QUERY_PORT = 5006      # clients send discovery queries here, reply is unicast
+QUERY_MESSAGE = b"NARRA_DISCOVER"
+
+MQTT_PORT = 1883
+WS_PORT = 9001
+HTTP_PORT = 8000
+
+# announce backoff: 1s, 2s, 4s ... capped, reset whenever ip or health changes
+ANNOUNCE_MIN = 1
+ANNOUNCE_MAX = 300
+RECHECK_INTERVAL = 10  # seconds between ip / health re-checks
+
+SIOCGIFADDR = 0x8915
+PREFERRED_IFACES = ("wlan0", "ap0", "uap0", "eth0")
+
+def get_iface_ip(ifname):
+    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        packed = struct.pack("256s", ifname.encode()[:15])
+        return socket.inet_ntoa(fcntl.ioctl(s.fileno(), SIOCGIFADDR, packed)[20:24])
+    except OSError:
+        return None
+    finally:
+        s.close()
 
 def get_local_ip():
+    # read interface addresses locally, no outside host needed (hotspot has no uplink)
+    names = [name for _, name in socket.if_nameindex() if name != "lo"]
+    names.sort(key=lambda n: PREFERRED_IFACES.index(n) if n in PREFERRED_IFACES else len(PREFERRED_IFACES))
+    for name in names:
+        ip = get_iface_ip(name)
+        if ip and not ip.startswith("127."):
+            return ip
+    return "127.0.0.1"
+
+def get_reply_ip(peer_ip):
+    # connecting a udp socket sends nothing, it only makes the kernel pick the
+    # local address on the route towards the client
     s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
     try:
-        s.connect(("8.8.8.8", 80))
+        s.connect((peer_ip, QUERY_PORT))
         return s.getsockname()[0]
+    except OSError:
+        return get_local_ip()
     finally:
         s.close()
 
-local_ip = get_local_ip()
+def is_port_open(port):
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.settimeout(0.2)
+        return s.connect_ex(("127.0.0.1", port)) == 0
+
+def get_health():
+    return {
+        "mqtt": is_port_open(MQTT_PORT),
+        "ws": is_port_open(WS_PORT),
+        "http": is_port_open(HTTP_PORT),
+    }
+
+def build_message(ip, health):
+    return json.dumps({
+        "ip": ip,
+        "mqttPort": MQTT_PORT,
+        "wsPort": WS_PORT,
+        "httpPort": HTTP_PORT,
+        "health": health
+    }).encode()
+
+def run():
+    announce_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    announce_sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+
+    query_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    query_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    query_sock.bind(("", QUERY_PORT))
+
+    local_ip = get_local_ip()
+    health = get_health()
+    interval = ANNOUNCE_MIN
+    next_announce = time.monotonic()
+    next_recheck = time.monotonic() + RECHECK_INTERVAL
+
+    while True:
+        now = time.monotonic()
+        timeout = max(0, min(next_announce, next_recheck) - now)
+        readable, _, _ = select.select([query_sock], [], [], timeout)
+
+        if readable:
+            data, addr = query_sock.recvfrom(512)
+            if data.strip() == QUERY_MESSAGE:
+                reply = build_message(get_reply_ip(addr[0]), health)
+                try:
+                    query_sock.sendto(reply, addr)
+                    print(f"Answered query from {addr[0]}")
+                except OSError as e:
+                    # same as announces, the interface may drop while the hotspot restarts
+                    print(f"Reply to {addr[0]} failed: {e}")
 
-message = json.dumps({
-    "ip": local_ip,
-    "mqttPort": 1883,
-    "wsPort": 9001,
-    "httpPort": 8000
-})
+        now = time.monotonic()
+        if now >= next_recheck:
+            new_ip = get_local_ip()
+            new_health = get_health()
+            if new_ip != local_ip or new_health != health:
+                print(f"State changed: ip={new_ip} health={new_health}")
+                local_ip, health = new_ip, new_health
+                interval = ANNOUNCE_MIN
+                next_announce = now
+            next_recheck = now + RECHECK_INTERVAL
 
-sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        if now >= next_announce:
+            message = build_message(local_ip, health)
+            try:
+                announce_sock.sendto(message, (BROADCAST_IP, PORT))
+                print(f"Broadcasted: {message.decode()}")
+            except OSError as e:
+                # interface may be down while the hotspot restarts
+                print(f"Broadcast failed: {e}")
+            next_announce = now + interval
+            interval = min(interval * 2, ANNOUNCE_MAX)
 
-while True:
-    sock.sendto(message.encode(), (BROADCAST_IP, PORT))
-    print(f"Broadcasted: {message}")
-    time.sleep(5)
\ No newline at end of file
+if __name__ == "__main__":
+    run()
@@ -16,6 +16,35 @@
 /*!40101 SET @OLD_SQL_MODE=@@SQL_MODE, SQL_MODE='NO_AUTO_VALUE_ON_ZERO' */;
 /*!40111 SET @OLD_SQL_NOTES=@@SQL_NOTES, SQL_NOTES=0 */;
 
+--
+-- Table structure for table `Change_Log`
+--
+
+DROP TABLE IF EXISTS `Change_Log`;
+/*!40101 SET @saved_cs_client     = @@character_set_client */;
+/*!40101 SET character_set_client = utf8mb4 */;
+CREATE TABLE `Change_Log` (
+  `Change_ID` bigint(20) NOT NULL AUTO_INCREMENT,
+  `Entity` enum('Soil','Parameter') NOT NULL,
+  `Entity_ID` int(11) NOT NULL,
+  `Soil_ID` int(11) DEFAULT NULL,
+  `Operation` enum('upsert','delete') NOT NULL,
+  `Changed_At` timestamp NOT NULL DEFAULT current_timestamp(),
+  PRIMARY KEY (`Change_ID`),
+  KEY `idx_Changed_At` (`Changed_At`),
+  KEY `idx_Entity` (`Entity`,`Entity_ID`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
+/*!40101 SET character_set_client = @saved_cs_client */;
+
+--
+-- Dumping data for table `Change_Log`
+--
+
+LOCK TABLES `Change_Log` WRITE;
+/*!40000 ALTER TABLE `Change_Log` DISABLE KEYS */;
+/*!40000 ALTER TABLE `Change_Log` ENABLE KEYS */;
+UNLOCK TABLES;
+
 --
 -- Table structure for table `Parameters`
 --
@@ -35,8 +64,13 @@ CREATE TABLE `Parameters` (
   `POTASSIUM` float NOT NULL,
   `Comments` mediumtext NOT NULL,
   `Date_Recorded` timestamp NOT NULL DEFAULT current_timestamp(),
+  `Suitable` tinyint(1) DEFAULT NULL,
+  `Suitability` float DEFAULT NULL,
+  `Model_Version` varchar(32) DEFAULT NULL,
   PRIMARY KEY (`Parameters_ID`),
   KEY `fk_Soil_ID` (`Soil_ID`),
+  KEY `idx_Date_Recorded` (`Date_Recorded`),
+  KEY `idx_Model_Version` (`Model_Version`),
   CONSTRAINT `fk_Soil_ID` FOREIGN KEY (`Soil_ID`) REFERENCES `Soils` (`Soil_ID`)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
 /*!40101 SET character_set_client = @saved_cs_client */;
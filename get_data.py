@@ -1,7 +1,11 @@
 import serial
-def get_sensor_data(mqtt_client):
+import time
+def get_sensor_data(mqtt_client, timeout=None):
+	# timeout: give up after this many seconds without a line and return None
 	ser = serial.Serial('/dev/ttyUSB0',9600,timeout=1)
 	ser.reset_input_buffer()
+	line = None
+	deadline = None if timeout is None else time.time() + timeout
 	n = 1
 	while(n == 1):
 		if ser.in_waiting > 0:
@@ -9,4 +13,7 @@ def get_sensor_data(mqtt_client):
 			mqtt_client.publish("get_data", line)
 			print(line)
 			n = n - 1
+		elif deadline is not None and time.time() >= deadline:
+			n = n - 1
 	ser.close()
+	return line
@@ -0,0 +1,122 @@
+# Load test for admission control: write latency on /add/parameter/ on its own
+# and again while a flood of history reads hits /soils/parameters/{Soil_ID}.
+# Run against a test server, every write adds a reading to the given soil.
+#   python load_test_admission.py [base_url] [soil_id] [readers]
+# or without a server or database, through the real app and middleware with
+# get_db stubbed (history queries take SLOW_QUERY, everything else FAST_QUERY):
+#   python load_test_admission.py --in-process [readers]
+import asyncio
+import statistics
+import sys
+import time
+
+import httpx
+
+WRITES = 50
+WRITE_INTERVAL = 0.1
+
+SLOW_QUERY = 0.05
+FAST_QUERY = 0.005
+
+class StubCursor:
+    lastrowid = 1
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
+
+    async def execute(self, query, args=None):
+        history = query.startswith("SELECT Parameters_ID") and "Parameters_ID = %s" not in query
+        await asyncio.sleep(SLOW_QUERY if history else FAST_QUERY)
+        if "FROM Soils" in query:
+            self.rows = [(1, "load test", 0.0, 0.0)]
+        else:
+            self.rows = [(1, 40.0, 26.5, 1250.0, 6.5, 70.0, 20.0, 160.0, "load test", "2025-01-01 00:00:00", None, None, None)]
+
+    async def fetchone(self):
+        return self.rows[0]
+
+    async def fetchall(self):
+        return self.rows
+
+class StubDB:
+    def cursor(self):
+        return StubCursor()
+
+    async def commit(self):
+        pass
+
+    async def rollback(self):
+        pass
+
+async def stub_db():
+    yield StubDB()
+
+def in_process_client(**kwargs):
+    import main
+    main.app.dependency_overrides[main.get_db] = stub_db
+    main.read_archived_parameters = lambda *args, **kw: []
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), **kwargs)
+
+def write_body(soil_id):
+    return {
+        "Soil_ID": soil_id,
+        "Parameters": {
+            "Hum": 40.0, "Temp": 26.5, "Ec": 1250.0, "Ph": 6.5,
+            "Nitrogen": 70.0, "Phosphorus": 20.0, "Potassium": 160.0,
+            "Comments": "load test"
+        }
+    }
+
+async def writer(client, soil_id):
+    latencies = []
+    failed = 0
+    for _ in range(WRITES):
+        start = time.perf_counter()
+        r = await client.post("/add/parameter/", json=write_body(soil_id))
+        latencies.append((time.perf_counter() - start) * 1000)
+        if r.status_code != 200:
+            failed += 1
+        await asyncio.sleep(WRITE_INTERVAL)
+    return latencies, failed
+
+async def reader(client, soil_id, stop, counts):
+    while not stop.is_set():
+        r = await client.get(f"/soils/parameters/{soil_id}")
+        counts[r.status_code] = counts.get(r.status_code, 0) + 1
+        if r.status_code == 503:
+            await asyncio.sleep(0.05)
+
+def summary(label, latencies, failed):
+    latencies = sorted(latencies)
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(f"{label}: p50 {statistics.median(latencies):.1f} ms, p95 {p95:.1f} ms, max {latencies[-1]:.1f} ms, failed {failed}")
+
+async def main(base_url, soil_id, readers, in_process=False):
+    limits = httpx.Limits(max_connections=readers + 10)
+    make_client = in_process_client if in_process else httpx.AsyncClient
+    async with make_client(base_url=base_url, limits=limits, timeout=30) as client:
+        latencies, failed = await writer(client, soil_id)
+        summary("writes, idle", latencies, failed)
+
+        stop = asyncio.Event()
+        counts = {}
+        tasks = [asyncio.create_task(reader(client, soil_id, stop, counts)) for _ in range(readers)]
+        latencies, failed = await writer(client, soil_id)
+        stop.set()
+        await asyncio.gather(*tasks)
+        summary(f"writes, {readers} readers", latencies, failed)
+        print(f"reads by status: {counts}")
+        print(f"admission metrics: {(await client.get('/metrics/admission')).json()}")
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--in-process":
+        asyncio.run(main("http://test", 1, int(sys.argv[2]) if len(sys.argv) > 2 else 50, in_process=True))
+    else:
+        asyncio.run(main(
+            sys.argv[1] if len(sys.argv) > 1 else "http://localhost:8000",
+            int(sys.argv[2]) if len(sys.argv) > 2 else 1,
+            int(sys.argv[3]) if len(sys.argv) > 3 else 50,
+        ))
@@ -1,7 +1,12 @@
 from typing import List, Optional
-from fastapi import FastAPI, HTTPException, Depends
-from models import Soil, Parameter, SoilParameterList, SoilCreate, ParameterCreate, CreateItem, AddParameter, DeleteParameter, DeleteResponse
+from fastapi import FastAPI, HTTPException, Depends, Request
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse
+from models import Soil, Parameter, SoilParameterList, SoilCreate, ParameterCreate, CreateItem, AddParameter, DeleteParameter, DeleteResponse, SyncResponse
+from archiver import read_archived_parameters, delete_archived_soil, delete_archived_parameter, to_local_naive
+from admission import AdmissionController, Overloaded, classify
 import aiomysql
+import asyncio
 import os 
 from dotenv import load_dotenv
 from datetime import datetime
@@ -10,6 +15,41 @@ load_dotenv()
 
 app = FastAPI()
 
+# brotli when the optional brotli-asgi package is installed, it falls back to gzip
+# for clients that do not accept br
+try:
+    from brotli_asgi import BrotliMiddleware
+    app.add_middleware(BrotliMiddleware, minimum_size=500)
+except ImportError:
+    app.add_middleware(GZipMiddleware, minimum_size=500)
+
+# changes younger than this are held back from /sync so a transaction that took a
+# lower Change_ID but commits late is not skipped by a client's watermark
+SYNC_SETTLE_SECONDS = 2
+SYNC_MAX_LIMIT = 1000
+
+admission = AdmissionController()
+
+# scanner writes and live reads go ahead of bulk history reads, requests that
+# cannot get a slot in time are shed with 503 instead of piling up
+@app.middleware("http")
+async def admission_control(request: Request, call_next):
+    if request.url.path == "/metrics/admission":
+        return await call_next(request)
+    route_class = classify(request.method, request.url.path)
+    try:
+        await admission.acquire(route_class)
+    except Overloaded as e:
+        return JSONResponse(
+            status_code=503,
+            content={"detail": "Server busy, try again later"},
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    try:
+        return await call_next(request)
+    finally:
+        admission.release(route_class)
+
 async def get_db():
     async with aiomysql.connect(
         host=os.getenv("HOST"),
@@ -30,10 +70,20 @@ def formatDate(iso_date):
     formatted = date.strftime("%b %d, %Y %I:%M %p")
     return formatted
 
+async def log_change(cur, entity, entity_id, soil_id, operation):
+    await cur.execute(
+        "INSERT INTO Change_Log (Entity, Entity_ID, Soil_ID, Operation) VALUES (%s, %s, %s, %s)",
+        (entity, entity_id, soil_id, operation)
+    )
+
 @app.get("/")
 def root():
     return {"Hello":"World"}
 
+@app.get("/metrics/admission")
+def admission_metrics():
+    return admission.metrics()
+
 # Get all soils
 @app.get("/soils", response_model=List[Soil])
 async def get_soils(db=Depends(get_db)):
@@ -53,7 +103,7 @@ async def get_soils(db=Depends(get_db)):
 
 # Get parameters of a soil
 @app.get("/soils/parameters/{Soil_ID}", response_model=List[Parameter])
-async def get_parameters(Soil_ID: int, db=Depends(get_db)) -> List[Parameter]:
+async def get_parameters(Soil_ID: int, since: Optional[datetime] = None, until: Optional[datetime] = None, db=Depends(get_db)) -> List[Parameter]:
     async with db.cursor() as cur:
         await cur.execute("SELECT Soil_ID, Soil_Name, ST_X(Soil_Location) as Loc_Longitude, ST_Y(Soil_Location) as Loc_Latitude FROM Soils WHERE Soil_ID = %s", (Soil_ID))
         row = await cur.fetchone()
@@ -65,8 +115,21 @@ async def get_parameters(Soil_ID: int, db=Depends(get_db)) -> List[Parameter]:
             Loc_Longitude = row[2],
             Loc_Latitude = row[3],
         )
-        await cur.execute("SELECT Parameters_ID, HUM, TEMP, EC, PH, NITROGEN, PHOSPHORUS, POTASSIUM, Comments, Date_Recorded FROM Parameters WHERE Soil_ID = %s", (Soil_ID))
-        rows = await cur.fetchall()
+        since, until = to_local_naive(since), to_local_naive(until)
+        query = "SELECT Parameters_ID, HUM, TEMP, EC, PH, NITROGEN, PHOSPHORUS, POTASSIUM, Comments, Date_Recorded, Suitable, Suitability, Model_Version FROM Parameters WHERE Soil_ID = %s"
+        args = [Soil_ID]
+        if since is not None:
+            query += " AND Date_Recorded >= %s"
+            args.append(since)
+        if until is not None:
+            query += " AND Date_Recorded <= %s"
+            args.append(until)
+        await cur.execute(query + " ORDER BY Parameters_ID", args)
+        hot_rows = await cur.fetchall()
+        # older readings live in the archive, db rows win if a reading is in both
+        archived_rows = await asyncio.to_thread(read_archived_parameters, Soil_ID, since, until)
+        hot_ids = {row[0] for row in hot_rows}
+        rows = [row for row in archived_rows if row[0] not in hot_ids] + list(hot_rows)
         if not rows:
             raise HTTPException(status_code=404, detail="Soil Parameters not found")
         parameters = []
@@ -82,7 +145,10 @@ async def get_parameters(Soil_ID: int, db=Depends(get_db)) -> List[Parameter]:
                 Phosphorus=row[6],
                 Potassium=row[7],
                 Comments=row[8],
-                Date_Recorded=formatDate(row[9])
+                Date_Recorded=formatDate(row[9]),
+                Suitable=row[10],
+                Suitability=row[11],
+                Model_Version=row[12]
             )
             parameters.append(parameter)
         return parameters
@@ -101,8 +167,11 @@ async def get_specific_parameter(Soil_ID: int, Parameter_ID: int, db=Depends(get
             Loc_Longitude = row[2],
             Loc_Latitude = row[3],
         )
-        await cur.execute("SELECT Parameters_ID, HUM, TEMP, EC, PH, NITROGEN, PHOSPHORUS, POTASSIUM Comments, Date_Recorded FROM Parameters WHERE Parameters_ID = %s AND Soil_ID = %s", (Parameter_ID, Soil_ID))
+        await cur.execute("SELECT Parameters_ID, HUM, TEMP, EC, PH, NITROGEN, PHOSPHORUS, POTASSIUM, Comments, Date_Recorded, Suitable, Suitability, Model_Version FROM Parameters WHERE Parameters_ID = %s AND Soil_ID = %s", (Parameter_ID, Soil_ID))
         row = await cur.fetchone()
+        if not row:
+            archived_rows = await asyncio.to_thread(read_archived_parameters, Soil_ID, parameter_id=Parameter_ID)
+            row = archived_rows[0] if archived_rows else None
         if not row:
             raise HTTPException(status_code=404, detail="Soil Parameter not found")
         parameter = Parameter(
@@ -116,7 +185,10 @@ async def get_specific_parameter(Soil_ID: int, Parameter_ID: int, db=Depends(get
             Phosphorus=row[6],
             Potassium=row[7],
             Comments=row[8],
-                Date_Recorded=formatDate(row[9])
+            Date_Recorded=formatDate(row[9]),
+            Suitable=row[10],
+            Suitability=row[11],
+            Model_Version=row[12]
         )
         soil_parameter = SoilParameterList(
             Soil = soil,
@@ -133,17 +205,19 @@ async def create_soil(item: CreateItem, db=Depends(get_db)):
                 "INSERT INTO Soils (Soil_Name, Soil_Location) VALUES (%s, ST_GeomFromText('POINT(%s %s)', 4326))",
                 (item.Soil.Soil_Name, item.Soil.Loc_Longitude, item.Soil.Loc_Latitude)
             )
-            await db.commit()
             
             # Get the inserted soil ID
             await cur.execute("SELECT LAST_INSERT_ID()")
             id_of_Soil = await cur.fetchone()
+            await log_change(cur, "Soil", id_of_Soil[0], id_of_Soil[0], "upsert")
+            await db.commit()
             
             # Insert parameter data
             await cur.execute(
                 "INSERT INTO Parameters (Soil_ID, HUM, TEMP, EC, PH, NITROGEN, PHOSPHORUS, POTASSIUM, Comments) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)",
                 (id_of_Soil[0], item.Parameters.Hum, item.Parameters.Temp, item.Parameters.Ec, item.Parameters.Ph, item.Parameters.Nitrogen, item.Parameters.Phosphorus, item.Parameters.Potassium, item.Parameters.Comments)
             )
+            await log_change(cur, "Parameter", cur.lastrowid, id_of_Soil[0], "upsert")
             await db.commit()
             return item
             
@@ -164,6 +238,7 @@ async def create_parameter(item: AddParameter, db=Depends(get_db)):
                 "INSERT INTO Parameters (Soil_ID, HUM, TEMP, EC, PH, NITROGEN, PHOSPHORUS, POTASSIUM, Comments) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)",
                 (item.Soil_ID, item.Parameters.Hum, item.Parameters.Temp, item.Parameters.Ec, item.Parameters.Ph, item.Parameters.Nitrogen, item.Parameters.Phosphorus, item.Parameters.Potassium, item.Parameters.Comments)
             )
+            await log_change(cur, "Parameter", cur.lastrowid, item.Soil_ID, "upsert")
             await db.commit()
             return item
         except Exception as e:
@@ -176,18 +251,131 @@ async def delete_soil(Soil_ID: int, db=Depends(get_db)) -> DeleteResponse:
         await cur.execute("SELECT Soil_ID FROM Soils WHERE Soil_ID = %s", (Soil_ID,))
         if not await cur.fetchone():
             raise HTTPException(status_code=404, detail="Soil not found")
+        # tombstones for the soil's parameters so clients can drop them too
+        await cur.execute(
+            "INSERT INTO Change_Log (Entity, Entity_ID, Soil_ID, Operation) SELECT 'Parameter', Parameters_ID, Soil_ID, 'delete' FROM Parameters WHERE Soil_ID = %s",
+            (Soil_ID,)
+        )
         await cur.execute("DELETE FROM Parameters WHERE Soil_ID = %s", (Soil_ID,))
         await db.commit()
         await cur.execute("DELETE FROM Soils WHERE Soil_ID = %s", (Soil_ID,))
+        await log_change(cur, "Soil", Soil_ID, Soil_ID, "delete")
         await db.commit()
+        await asyncio.to_thread(delete_archived_soil, Soil_ID)
         return DeleteResponse(message="Soil deleted successfully")
 
 @app.delete("/delete/parameter/{Parameter_ID}", response_model=DeleteResponse)
 async def delete_parameter(Parameter_ID: int, db=Depends(get_db)) -> DeleteResponse:
     async with db.cursor() as cur:
-        await cur.execute("SELECT Parameters_ID FROM Parameters WHERE Parameters_ID = %s", (Parameter_ID,))
-        if not await cur.fetchone():
+        await cur.execute("SELECT Parameters_ID, Soil_ID FROM Parameters WHERE Parameters_ID = %s", (Parameter_ID,))
+        row = await cur.fetchone()
+        if not row:
+            # the change log knows which soil an archived reading belongs to, so
+            # only that soil's archive is searched
+            await cur.execute(
+                "SELECT Soil_ID FROM Change_Log WHERE Entity = 'Parameter' AND Entity_ID = %s AND Soil_ID IS NOT NULL LIMIT 1",
+                (Parameter_ID,)
+            )
+            logged = await cur.fetchone()
+            soil_id = logged[0] if logged else None
+            if soil_id is not None and await asyncio.to_thread(delete_archived_parameter, soil_id, Parameter_ID):
+                await log_change(cur, "Parameter", Parameter_ID, soil_id, "delete")
+                await db.commit()
+                return DeleteResponse(message="Parameter deleted successfully")
             raise HTTPException(status_code=404, detail="Parameter not found")
         await cur.execute("DELETE FROM Parameters WHERE Parameters_ID = %s", (Parameter_ID,))
+        await log_change(cur, "Parameter", Parameter_ID, row[1], "delete")
         await db.commit()
         return DeleteResponse(message="Parameter deleted successfully")
+
+# Changes since a watermark, for clients that keep a local copy
+@app.get("/sync", response_model=SyncResponse)
+async def sync(since: int = 0, limit: int = 500, db=Depends(get_db)) -> SyncResponse:
+    limit = max(1, min(limit, SYNC_MAX_LIMIT))
+    async with db.cursor() as cur:
+        await cur.execute(
+            "SELECT Change_ID, Entity, Entity_ID, Soil_ID, Operation FROM Change_Log WHERE Change_ID > %s AND Changed_At <= NOW() - INTERVAL %s SECOND ORDER BY Change_ID LIMIT %s",
+            (since, SYNC_SETTLE_SECONDS, limit)
+        )
+        changes = await cur.fetchall()
+        if not changes:
+            return SyncResponse(watermark=since, has_more=False)
+
+        # only the last operation on an entity within the page matters
+        latest = {}
+        change_soil = {}
+        deleted_in_page = set()
+        for _, entity, entity_id, soil_id, operation in changes:
+            latest[(entity, entity_id)] = operation
+            change_soil[(entity, entity_id)] = soil_id
+            if operation == "delete":
+                deleted_in_page.add((entity, entity_id))
+        soil_ids = [eid for (entity, eid), op in latest.items() if entity == "Soil" and op == "upsert"]
+        parameter_ids = [eid for (entity, eid), op in latest.items() if entity == "Parameter" and op == "upsert"]
+
+        soils = []
+        found_soil_ids = set()
+        if soil_ids:
+            await cur.execute(
+                "SELECT Soil_ID, Soil_Name, ST_X(Soil_Location) as Loc_Longitude, ST_Y(Soil_Location) as Loc_Latitude FROM Soils WHERE Soil_ID IN (" + ", ".join(["%s"] * len(soil_ids)) + ")",
+                soil_ids
+            )
+            for row in await cur.fetchall():
+                found_soil_ids.add(row[0])
+                soils.append(Soil(
+                    Soil_ID=formatID(row[0], "Soil"),
+                    Soil_Name=row[1],
+                    Loc_Longitude=row[2],
+                    Loc_Latitude=row[3]
+                ))
+
+        # (Soil_ID, row in archiver.COLUMNS order) for each parameter to send
+        parameter_rows = []
+        if parameter_ids:
+            await cur.execute(
+                "SELECT Soil_ID, Parameters_ID, HUM, TEMP, EC, PH, NITROGEN, PHOSPHORUS, POTASSIUM, Comments, Date_Recorded, Suitable, Suitability, Model_Version FROM Parameters WHERE Parameters_ID IN (" + ", ".join(["%s"] * len(parameter_ids)) + ")",
+                parameter_ids
+            )
+            parameter_rows = [(row[0], row[1:]) for row in await cur.fetchall()]
+
+            # readings the archiver moved out of the table since they were logged
+            missing = set(parameter_ids) - {row[0] for _, row in parameter_rows}
+            missing_by_soil = {}
+            for parameter_id in missing:
+                missing_by_soil.setdefault(change_soil[("Parameter", parameter_id)], set()).add(parameter_id)
+            for soil_id, ids in missing_by_soil.items():
+                archived_rows = await asyncio.to_thread(read_archived_parameters, soil_id, parameter_ids=ids)
+                parameter_rows += [(soil_id, row) for row in archived_rows]
+
+        parameters = []
+        for soil_id, row in parameter_rows:
+            parameters.append(Parameter(
+                Parameter_ID=formatID(row[0], "Parameter"),
+                Soil_ID=formatID(soil_id, "Soil"),
+                Hum=row[1],
+                Temp=row[2],
+                Ec=row[3],
+                Ph=row[4],
+                Nitrogen=row[5],
+                Phosphorus=row[6],
+                Potassium=row[7],
+                Comments=row[8],
+                Date_Recorded=formatDate(row[9]),
+                Suitable=row[10],
+                Suitability=row[11],
+                Model_Version=row[12]
+            ))
+
+        # an upsert logged after a delete (a write racing the delete) must not hide
+        # it: rows that are gone send the tombstone from this page, rows gone without
+        # one here have their tombstone further on in the log
+        found = {("Soil", soil_id) for soil_id in found_soil_ids} | {("Parameter", row[0]) for _, row in parameter_rows}
+        deleted = [key for key, op in latest.items() if op == "delete" or (key in deleted_in_page and key not in found)]
+        return SyncResponse(
+            Soils=soils,
+            Parameters=parameters,
+            Deleted_Soils=[formatID(eid, "Soil") for entity, eid in deleted if entity == "Soil"],
+            Deleted_Parameters=[formatID(eid, "Parameter") for entity, eid in deleted if entity == "Parameter"],
+            watermark=changes[-1][0],
+            has_more=len(changes) == limit
+        )
@@ -170,6 +170,23 @@ class NarraSoilClassifier:
             'recommendations': recommendations
         }
     
+    def score_batch(self, X):
+        """
+        Score many readings at once, without explanations
+
+        Args:
+            X: 2D array with one row per reading, columns in feature_names order
+
+        Returns:
+            (suitable, probability) arrays, probability is for the suitable class
+        """
+        if self.model is None:
+            raise ValueError("Model not trained or loaded")
+
+        X = pd.DataFrame(np.asarray(X, dtype=float), columns=self.feature_names)
+        probability = self.model.predict_proba(X)[:, 1]
+        return self.model.predict(X).astype(bool), probability
+
     def _generate_explanation(self, prediction, contributions):
         """Generate human-readable explanation"""
         if prediction == 1:
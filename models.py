@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional
 
 class Soil(BaseModel):
     Soil_ID: str
@@ -19,6 +19,10 @@ class Parameter(BaseModel):
     Potassium: float
     Comments: str
     Date_Recorded: str
+    # filled in by scorer.py, None until the reading has been scored
+    Suitable: Optional[bool] = None
+    Suitability: Optional[float] = None
+    Model_Version: Optional[str] = None
 
 class SoilParameterList(BaseModel):
     Soil: Soil
@@ -54,4 +58,12 @@ class DeleteSoil(BaseModel):
     Soil_ID: int
 
 class DeleteResponse(BaseModel):
-    message: str
\ No newline at end of file
+    message: str
+
+class SyncResponse(BaseModel):
+    Soils: List[Soil] = []
+    Parameters: List[Parameter] = []
+    Deleted_Soils: List[str] = []
+    Deleted_Parameters: List[str] = []
+    watermark: int
+    has_more: bool
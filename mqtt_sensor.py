@@ -1,13 +1,22 @@
 import json
+import os
 import time
 import paho.mqtt.client as mqtt
 from get_data import get_sensor_data
+from sensor_codec import encode_batch, parse_line, BINARY_TOPIC, FORMATS, FORMATS_TOPIC, MAX_BATCH
 import random
 
+DEVICE_ID = int(os.getenv("DEVICE_ID", "1"))
+BATCH_SIZE = max(1, min(int(os.getenv("BATCH_SIZE", "10")), MAX_BATCH))  # a batch message holds at most MAX_BATCH readings
+BATCH_INTERVAL = float(os.getenv("BATCH_INTERVAL", "30"))  # max seconds a reading waits in a batch
+
 client = mqtt.Client()
 client.connect("localhost", 1883, 60)
+client.publish(FORMATS_TOPIC, FORMATS, retain=True)
 
 def publish_sensor_data():
+    batch = []
+    batch_started = time.time()
     while True:
         # Fake sensor data
         # sensor_data = {
@@ -24,8 +33,18 @@ def publish_sensor_data():
         # print(f"Published: {payload}")
         # time.sleep(3)  # publish every 5 seconds
 
-        # actual sensor data
-        get_sensor_data(client)
+        # actual sensor data, text goes out per reading, binary in batches
+        # with a batch pending, stop waiting on the serial port when it is due
+        timeout = max(0, batch_started + BATCH_INTERVAL - time.time()) if batch else None
+        line = get_sensor_data(client, timeout)
+        values = parse_line(line) if line is not None else None
+        if values is not None:
+            if not batch:
+                batch_started = time.time()
+            batch.append((DEVICE_ID, time.time(), values))
+        if batch and (len(batch) >= BATCH_SIZE or time.time() - batch_started >= BATCH_INTERVAL):
+            client.publish(BINARY_TOPIC, encode_batch(batch))
+            batch = []
         time.sleep(3)
 
 publish_sensor_data()
@@ -0,0 +1,132 @@
+import asyncio
+import hashlib
+import os
+
+import aiomysql
+import numpy as np
+from dotenv import load_dotenv
+
+from ml_model import NarraSoilClassifier
+
+load_dotenv()
+
+MODEL_PATH = os.getenv("MODEL_PATH", "narra_model.joblib")
+SCORE_BATCH = int(os.getenv("SCORE_BATCH", "500"))
+SCORE_INTERVAL = float(os.getenv("SCORE_INTERVAL", "5"))   # idle wait between checks for new rows
+RESCORE_PAUSE = float(os.getenv("RESCORE_PAUSE", "0.2"))   # pause between re-score chunks so ingestion keeps going
+
+# db columns in NarraSoilClassifier.feature_names order
+FEATURE_COLUMNS = "HUM, TEMP, EC, PH, NITROGEN, PHOSPHORUS, POTASSIUM"
+
+UPDATE_SQL = "UPDATE Parameters SET Suitable = %s, Suitability = %s, Model_Version = %s WHERE Parameters_ID = %s"
+# scores change the row, so /sync clients have to fetch it again. Logged from the
+# table, a row the api deleted since the select gets no upsert after its tombstone
+LOG_SQL = "INSERT INTO Change_Log (Entity, Entity_ID, Soil_ID, Operation) SELECT 'Parameter', Parameters_ID, Soil_ID, 'upsert' FROM Parameters WHERE Parameters_ID IN ({})"
+
+def model_version(path=MODEL_PATH):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()[:12]
+
+def load_classifier():
+    classifier = NarraSoilClassifier()
+    classifier.load_model(MODEL_PATH)
+    return classifier, model_version(), os.path.getmtime(MODEL_PATH)
+
+async def score_rows(conn, cur, classifier, version, rows):
+    ids = [row[0] for row in rows]
+    suitable, probability = classifier.score_batch(np.array([row[1:] for row in rows], dtype=float))
+    await conn.begin()
+    await cur.executemany(UPDATE_SQL, [
+        (int(s), float(p), version, pid) for s, p, pid in zip(suitable, probability, ids)
+    ])
+    await cur.execute(LOG_SQL.format(", ".join(["%s"] * len(ids))), ids)
+    await conn.commit()
+
+async def score_new(conn, classifier, version):
+    """Score rows that have never been scored, returns how many were scored."""
+    scored = 0
+    async with conn.cursor() as cur:
+        while True:
+            await cur.execute(
+                f"SELECT Parameters_ID, {FEATURE_COLUMNS} FROM Parameters WHERE Model_Version IS NULL ORDER BY Parameters_ID LIMIT %s",
+                (SCORE_BATCH,)
+            )
+            rows = await cur.fetchall()
+            if not rows:
+                return scored
+            await score_rows(conn, cur, classifier, version, rows)
+            scored += len(rows)
+
+async def rescore_chunk(conn, classifier, version, after_id):
+    """Re-score the next primary key chunk scored by an older model. Returns (last id, rows), last id is None when done."""
+    async with conn.cursor() as cur:
+        await cur.execute(
+            f"SELECT Parameters_ID, {FEATURE_COLUMNS} FROM Parameters WHERE Parameters_ID > %s AND Model_Version <> %s ORDER BY Parameters_ID LIMIT %s",
+            (after_id, version, SCORE_BATCH)
+        )
+        rows = await cur.fetchall()
+        if not rows:
+            return None, 0
+        await score_rows(conn, cur, classifier, version, rows)
+        return rows[-1][0], len(rows)
+
+async def count_stale(conn, version):
+    async with conn.cursor() as cur:
+        await cur.execute("SELECT COUNT(*) FROM Parameters WHERE Model_Version <> %s", (version,))
+        return (await cur.fetchone())[0]
+
+async def run(conn):
+    classifier, version, mtime = load_classifier()
+    print(f"Scoring with model {version}")
+    rescore_after = 0
+    stale = await count_stale(conn, version)
+    done = 0
+    while True:
+        # a new model file restarts the incremental re-score from the first id
+        if os.path.getmtime(MODEL_PATH) != mtime:
+            classifier, version, mtime = load_classifier()
+            print(f"Model changed, re-scoring with {version}")
+            rescore_after = 0
+            stale = await count_stale(conn, version)
+            done = 0
+
+        # new readings first so fresh rows never wait behind a re-score
+        scored = await score_new(conn, classifier, version)
+        if scored:
+            print(f"Scored {scored} new readings")
+
+        if rescore_after is not None:
+            last_id, n = await rescore_chunk(conn, classifier, version, rescore_after)
+            if last_id is None:
+                if stale:
+                    print(f"Re-score with model {version} done")
+                rescore_after = None
+            else:
+                done += n
+                print(f"Re-score progress: {done}/{stale} ({done * 100 // max(stale, 1)}%), up to id {last_id}")
+                rescore_after = last_id
+                await asyncio.sleep(RESCORE_PAUSE)
+                continue
+
+        await asyncio.sleep(SCORE_INTERVAL)
+
+async def main():
+    while True:
+        try:
+            async with aiomysql.connect(
+                host=os.getenv("HOST"),
+                user=os.getenv("DEV_USER"),
+                password=os.getenv("DEV_PASSWORD"),
+                db=os.getenv("PROD_DB"),
+                autocommit=True,  # every select sees rows committed by the api since the last one
+            ) as conn:
+                await run(conn)
+        except Exception as e:
+            print(f"Scorer failed: {e}")
+        await asyncio.sleep(SCORE_INTERVAL)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,58 @@
+import json
+import struct
+
+import numpy as np
+
+# Binary batch layout (little endian):
+#   header: magic b"NS", version u8, count u8
+#   record: device_id u16, timestamp f64 (unix seconds), then the seven readings as f32
+MAGIC = b"NS"
+VERSION = 1
+MAX_BATCH = 255
+HEADER = struct.Struct("<2sBB")
+RECORD = struct.Struct("<Hd7f")
+
+# serial line keys, in record order
+FIELDS = ["Moist", "Temp", "EC", "pH", "nitrogen", "phosphorus", "potassium"]
+
+# numpy view of RECORD, unaligned so it matches the packed struct byte for byte
+RECORD_DTYPE = np.dtype([("device_id", "<u2"), ("timestamp", "<f8")] + [(name, "<f4") for name in FIELDS])
+
+TEXT_TOPIC = "get_data"
+BINARY_TOPIC = "get_data/bin"
+FORMATS_TOPIC = "get_data/formats"
+
+# retained on FORMATS_TOPIC so consumers can pick the topic they understand
+FORMATS = json.dumps({
+    TEXT_TOPIC: "application/json",
+    BINARY_TOPIC: f"application/x-narra-batch; version={VERSION}; fields={','.join(FIELDS)}",
+})
+
+def parse_line(line):
+    """Parse a serial line into the seven readings, None if it is not a reading."""
+    try:
+        data = json.loads(line)
+        return tuple(float(data[name]) for name in FIELDS)
+    except (ValueError, KeyError, TypeError):
+        return None
+
+def encode_batch(readings):
+    """Pack a list of (device_id, timestamp, values) into one binary message."""
+    if not 0 < len(readings) <= MAX_BATCH:
+        raise ValueError(f"batch must hold 1 to {MAX_BATCH} readings")
+    buf = bytearray(HEADER.size + RECORD.size * len(readings))
+    HEADER.pack_into(buf, 0, MAGIC, VERSION, len(readings))
+    offset = HEADER.size
+    for device_id, timestamp, values in readings:
+        RECORD.pack_into(buf, offset, device_id, timestamp, *values)
+        offset += RECORD.size
+    return bytes(buf)
+
+def decode_batch(payload):
+    """Return a read-only structured array viewing the payload, no copy is made."""
+    magic, version, count = HEADER.unpack_from(payload, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("not a narra sensor batch")
+    if len(payload) != HEADER.size + RECORD.size * count:
+        raise ValueError("truncated sensor batch")
+    return np.frombuffer(payload, dtype=RECORD_DTYPE, count=count, offset=HEADER.size)